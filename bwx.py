@@ -1,18 +1,91 @@
 #!/usr/bin/env python3
-from dataclasses import asdict, dataclass, field
+from dataclasses import dataclass, field, fields
+import errno
+import hashlib
+import json
+from functools import lru_cache
 import logging
 from pathlib import Path
 import os
+import select
 import sys
 import shutil
 import signal
+import stat
 import subprocess
 from subprocess import SubprocessError
-import time
-from typing import List
-import yaml
+from typing import Callable, ClassVar, Dict, FrozenSet, List, Mapping, Optional, Tuple
 
-@dataclass
+logger = logging.getLogger("bwx")
+
+def _spawn_capture(path: str, argv: List[str], env: Mapping[str, str] = os.environ) -> str:
+  r, w = os.pipe() # non-inheritable, the dup2'ed stdout is not
+  try: pid = os.posix_spawn(path, argv, env, file_actions=[(os.POSIX_SPAWN_DUP2, w, 1)],
+    setsigdef=(signal.SIGPIPE, signal.SIGXFSZ)) # restore like subprocess' restore_signals
+  except OSError:
+    os.close(r)
+    raise
+  finally: os.close(w)
+  chunks = []
+  try:
+    while chunk := os.read(r, 4096): chunks.append(chunk)
+  finally: os.close(r)
+  _, status = os.waitpid(pid, 0)
+  returncode = os.waitstatus_to_exitcode(status)
+  if returncode != 0: raise subprocess.CalledProcessError(returncode, argv)
+  return b"".join(chunks).decode().strip()
+
+@lru_cache(maxsize=None)
+def _stat_files(paths: Tuple[Path, ...]) -> Tuple[Tuple[str, int, int], ...]:
+  stats = []
+  for file in paths:
+    try: st = file.stat()
+    except OSError: continue
+    if stat.S_ISREG(st.st_mode):
+      stats.append((str(file), st.st_mtime_ns, st.st_size))
+  return tuple(stats)
+
+def _is_executable(path: str) -> bool:
+  return bool(path) and os.access(path, os.X_OK) and not os.path.isdir(path)
+
+def _proc_start_time(pid: int) -> str: # identifies a process across pid reuse, "" if unknown
+  try: stat_line = Path(f"/proc/{pid}/stat").read_text()
+  except OSError: return ""
+  return stat_line.rsplit(")", 1)[1].split()[19] # field 22, after the parenthesized comm
+
+def _is_same_process(pid: int, start_time: str) -> bool:
+  if os.path.isdir("/proc/self"): return bool(start_time) and _proc_start_time(pid) == start_time
+  try: os.kill(pid, 0) # no procfs, best effort
+  except OSError: return False
+  return True
+
+def _pidfd_open(pid: int) -> Optional[int]:
+  try: return os.pidfd_open(pid)
+  except AttributeError: return None # not on Linux
+  except OSError as e:
+    if e.errno == errno.ENOSYS: return None # kernel < 5.3
+    raise
+
+def _terminate(pid: int, start_time: str) -> None:
+  try:
+    pidfd = _pidfd_open(pid) # pins the process, so the identity check below can't go stale
+    try:
+      if not _is_same_process(pid, start_time): raise ProcessLookupError(pid)
+      if pidfd is None: os.kill(pid, signal.SIGTERM)
+      else: signal.pidfd_send_signal(pidfd, signal.SIGTERM)
+    finally:
+      if pidfd is not None: os.close(pidfd)
+    logger.debug("sent SIGTERM to existing process %s", pid)
+  except ProcessLookupError:
+    logger.debug("process %s not found, likely already gone", pid)
+
+@lru_cache(maxsize=None)
+def _cfg_paths() -> Tuple[Path, ...]: # resolved lazily, __file__ is unset while mypyc modules import
+  dirs = (Path("/etc"), Path.home() / ".config", Path(__file__).parent)
+  return tuple(dir / f"bwx.{ext}" for dir in dirs for ext in ("json", "yml", "yaml"))
+CFG_CACHE_FILE = Path(os.getenv("XDG_RUNTIME_DIR", f"/run/user/{os.getuid()}")) / "bwx.cfg.json"
+
+@dataclass(slots=True)
 class Config:
   debug: bool = False
   transient_dir: str = os.getenv("XDG_RUNTIME_DIR", f"/run/user/{os.getuid()}")
@@ -20,28 +93,84 @@ class Config:
   clipboard_copy_cmd: List[str] = field(default_factory=lambda: [])
   clipboard_clear_cmd: List[str] = field(default_factory=lambda: [])
   clipboard_clear_timeout: int = 30 # seconds
+  bw_serve: bool = False
 
-  CFG_PATHS = (
-    Path("/etc/bwx.yml"),
-    Path("/etc/bwx.yaml"),
-    Path.home() / ".config" / "bwx.yml",
-    Path.home() / ".config" / "bwx.yaml",
-    Path(__file__).parent / "bwx.yml",
-    Path(__file__).parent / "bwx.yaml",
-  )
+  _resolved: dict = field(default_factory=dict, init=False, repr=False, compare=False) # command -> path
+  _bw_path: str = field(default="", init=False, repr=False, compare=False)
+  _copy_path: str = field(default="", init=False, repr=False, compare=False)
+  _clear_path: str = field(default="", init=False, repr=False, compare=False)
+  _systemd_run_path: str = field(default="", init=False, repr=False, compare=False) # optional
+  _systemctl_path: str = field(default="", init=False, repr=False, compare=False) # optional
+  _transient_path: Path = field(default_factory=Path, init=False, repr=False, compare=False)
 
   @classmethod
   def from_yaml(cls) -> "Config":
-    cfg = asdict(cls())
-    for file in cls.CFG_PATHS:
-      if not file.is_file(): continue
-      cfg.update(yaml.safe_load(file.read_text()) or {})
-    return cls(**cfg).validate()
-
-  def get_transient_path(self) -> Path:
-    dir = os.path.expandvars(self.transient_dir)
-    dir = os.path.expanduser(dir)
-    return Path(dir)
+    cfg_files = _stat_files(_cfg_paths())
+    key = (os.getenv("PATH", ""), cfg_files)
+    cached = cls._load_cache(key)
+    overrides, resolved = cached or (cls._parse_cfg_files(cfg_files) if cfg_files else {}, {})
+    cfg = cls()
+    options = {f.name for f in fields(cls) if f.init}
+    for option, value in overrides.items():
+      if option not in options: raise ValueError(f"unknown config option '{option}'")
+      setattr(cfg, option, value)
+    cfg._resolved.update(resolved)
+    cfg.validate()
+    if cached is None or cfg._resolved != resolved:
+      cls._save_cache(key, (overrides, cfg._resolved))
+    return cfg
+
+  @staticmethod
+  def _parse_cfg_files(cfg_files: tuple) -> dict:
+    overrides = {}
+    json_dirs = {os.path.dirname(file) for file, _, _ in cfg_files if file.endswith(".json")}
+    for file, _, _ in cfg_files:
+      if not file.endswith(".json") and os.path.dirname(file) in json_dirs:
+        logger.debug("ignoring %s, bwx.json in the same directory takes precedence", file)
+        continue
+      parse = Config._parse_json if file.endswith(".json") else Config._parse_yaml
+      data = parse(Path(file)) or {}
+      if not isinstance(data, dict):
+        raise ValueError(f"invalid config '{file}': expected a mapping of options, got {type(data).__name__}")
+      overrides.update(data)
+    return overrides
+
+  @staticmethod
+  def _parse_json(file: Path) -> object:
+    try: return json.loads(file.read_bytes())
+    except ValueError as e: raise ValueError(f"invalid config '{file}': {e}")
+
+  @staticmethod
+  def _parse_yaml(file: Path) -> object:
+    try: import yaml # deferred, only needed for YAML configs
+    except ImportError: raise ValueError(f"PyYAML is required to read config '{file}'")
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader) # libyaml if available
+    try: return yaml.load(file.read_text(), Loader=loader)
+    except yaml.YAMLError as e: raise ValueError(f"invalid config '{file}': {e}")
+
+  @classmethod
+  def _load_cache(cls, key: tuple) -> Optional[tuple]:
+    try:
+      fd = os.open(CFG_CACHE_FILE, os.O_RDONLY | os.O_NOFOLLOW)
+      with os.fdopen(fd, "rb") as f:
+        st = os.fstat(f.fileno())
+        if st.st_uid != os.getuid() or st.st_mode & 0o022: return None # not ours alone, don't trust it
+        cached_key, (overrides, resolved) = json.load(f)
+      if cached_key != json.loads(json.dumps(key)): return None # tuples come back as lists
+      if isinstance(overrides, dict) and isinstance(resolved, dict): return overrides, resolved
+    except (OSError, ValueError, TypeError): pass # missing or corrupt, fall back to parsing
+    return None
+
+  @classmethod
+  def _save_cache(cls, key: tuple, cached: tuple) -> None:
+    tmp_file = CFG_CACHE_FILE.with_suffix(".tmp")
+    try:
+      fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+      with os.fdopen(fd, "w") as f: json.dump((key, cached), f)
+      os.replace(tmp_file, CFG_CACHE_FILE)
+    except (OSError, TypeError, ValueError): pass # caching is best effort, e.g. values JSON cannot hold
+
+  def get_transient_path(self) -> Path: return self._transient_path
   
   def is_copy_enabled(self) -> bool: return bool(self.clipboard_copy_cmd)
 
@@ -50,22 +179,44 @@ class Config:
   def validate(self) -> "Config":
     if not self.transient_dir:
       raise ValueError("transient directory not set")
-    self.get_transient_path().mkdir(exist_ok=True, mode=0o700)
-    if not shutil.which(self.bw_cmd):
-      raise ValueError(f"command '{self.bw_cmd}' not found")
-    if self.is_copy_enabled() and not shutil.which(self.clipboard_copy_cmd[0]):
-      raise ValueError(f"command '{self.clipboard_copy_cmd[0]}' not found")
-    if self.is_clear_enabled() and not shutil.which(self.clipboard_clear_cmd[0]):
-      raise ValueError(f"command '{self.clipboard_clear_cmd[0]}' not found")
+    self._transient_path = Path(os.path.expanduser(os.path.expandvars(self.transient_dir)))
+    try: transient_mode = self._transient_path.stat().st_mode
+    except FileNotFoundError: self._transient_path.mkdir(exist_ok=True, mode=0o700)
+    else:
+      if not stat.S_ISDIR(transient_mode):
+        raise ValueError(f"transient path '{self._transient_path}' is not a directory")
+    self._resolve_cmds()
     if self.is_clear_enabled() and self.clipboard_clear_timeout <= 0:
       raise ValueError("clipboard clear timeout must be positive")
     return self
 
+  def _resolve_cmds(self) -> None:
+    cmds, optional_cmds = [self.bw_cmd], []
+    if self.is_copy_enabled(): cmds.append(self.clipboard_copy_cmd[0])
+    if self.is_clear_enabled():
+      cmds.append(self.clipboard_clear_cmd[0])
+      optional_cmds = ["systemd-run", "systemctl"]
+    stale = [cmd for cmd in cmds if not _is_executable(self._resolved.get(cmd, ""))]
+    stale += [cmd for cmd in optional_cmds if cmd not in self._resolved
+      or (self._resolved[cmd] and not _is_executable(self._resolved[cmd]))]
+    for cmd in stale: # rare, resolutions are cached across runs
+      path = shutil.which(cmd)
+      if path: self._resolved[cmd] = path
+      else: self._resolved.pop(cmd, None)
+    for cmd in optional_cmds: self._resolved.setdefault(cmd, "") # cache misses too
+    for cmd in cmds:
+      if cmd not in self._resolved: raise ValueError(f"command '{cmd}' not found")
+    self._bw_path = self._resolved[self.bw_cmd]
+    if self.is_copy_enabled(): self._copy_path = self._resolved[self.clipboard_copy_cmd[0]]
+    if self.is_clear_enabled(): self._clear_path = self._resolved[self.clipboard_clear_cmd[0]]
+    self._systemd_run_path = self._resolved.get("systemd-run", "")
+    self._systemctl_path = self._resolved.get("systemctl", "")
+
 class CliInput:
-  def __init__(self):
-    self.global_flags = []
+  def __init__(self) -> None:
+    self.global_flags: List[str] = []
     self.cmd = "help"
-    self.cmd_input = []
+    self.cmd_input: List[str] = []
   
   def parse(self, argv: List[str]) -> None:
     for i, arg in enumerate(argv):
@@ -75,138 +226,270 @@ class CliInput:
         self.cmd = arg
         self.cmd_input = argv[i+1:]
         break
-    logger.debug(f"parsed {self}")
+    logger.debug("parsed %s", self)
 
   def __str__(self) -> str:
     return f"CliInput(cmd={self.cmd}, global_flags={self.global_flags}, cmd_input={self.cmd_input})"
 
 class Session:
-  SESSION_ENV = "BW_SESSION"
-  def __init__(self, cfg: Config):
+  SESSION_ENV: ClassVar[str] = "BW_SESSION"
+  def __init__(self, cfg: Config) -> None:
     self.cfg = cfg
     self.session_file = self.cfg.get_transient_path() / self.SESSION_ENV
 
   def unlock(self) -> str:
-    token = os.getenv(self.SESSION_ENV)
-    if token: return token    
-    token = self._load_session()
+    token = os.getenv(self.SESSION_ENV) or self._load_session()
     if not token: 
       logger.debug("unlocking vault...")
-      token = subprocess.check_output([self.cfg.bw_cmd, "unlock", "--raw"], text=True).strip()
+      token = _spawn_capture(self.cfg._bw_path, [self.cfg.bw_cmd, "unlock", "--raw"])
       if not token: raise ValueError("no session token received")
       self._save_session(token)
-    os.environ[self.SESSION_ENV] = token
+    if self.cfg.bw_serve: ServeDaemon(self.cfg).start(token)
     return token
 
   def _load_session(self) -> str:
-    if self.session_file.is_file():
-      logger.debug(f"loading session from {self.session_file}")
-      return self.session_file.read_text()
-    return ""
+    try: fd = os.open(self.session_file, os.O_RDONLY)
+    except FileNotFoundError: return ""
+    logger.debug("loading session from %s", self.session_file)
+    try: return os.read(fd, 4096).decode("ascii").strip()
+    finally: os.close(fd)
 
   def _save_session(self, token: str) -> None:
-    logger.debug(f"saving new session token to {self.session_file}")
-    self.session_file.touch(mode=0o600, exist_ok=True)
-    self.session_file.write_text(token)
+    logger.debug("saving new session token to %s", self.session_file)
+    fd = os.open(self.session_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try: os.write(fd, token.encode("ascii"))
+    finally: os.close(fd)
 
   def clear(self) -> None:
     logger.debug("clearing session")
     os.environ.pop(self.SESSION_ENV, None)
     if self.session_file.is_file():
       self.session_file.unlink(missing_ok=True)
+    ServeDaemon(self.cfg).stop()
+
+class ServeDaemon:
+  PID_FILE_NAME: ClassVar[str] = "bw_serve.pid"
+  HOST: ClassVar[str] = "127.0.0.1"
+  def __init__(self, cfg: Config) -> None:
+    self.cfg = cfg
+    self.pid_file = self.cfg.get_transient_path() / self.PID_FILE_NAME
+
+  def start(self, token: str) -> None:
+    digest = hashlib.sha256(token.encode()).hexdigest()[:16] # ties the server to the session it was started with
+    running = self._running()
+    if running and running[3] == digest: return
+    if running:
+      logger.debug("bw serve %s runs with another session, restarting", running[0])
+      self.stop()
+    import socket
+    with socket.socket() as sock: # let the kernel pick a free port
+      sock.bind((self.HOST, 0))
+      port = sock.getsockname()[1]
+    logger.debug("starting bw serve on port %s", port)
+    serve_process = subprocess.Popen([self.cfg.bw_cmd, "serve", "--hostname", self.HOST, "--port", str(port)],
+      executable=self.cfg._bw_path, env={**os.environ, Session.SESSION_ENV: token},
+      stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+      start_new_session=True)
+    start_time = _proc_start_time(serve_process.pid) or "-"
+    fd = os.open(self.pid_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f: f.write(f"{serve_process.pid} {port} {start_time} {digest}")
+
+  def stop(self) -> None:
+    running = self._running()
+    if running: _terminate(running[0], running[2])
+    self.pid_file.unlink(missing_ok=True)
+
+  def get_password(self, item: str) -> Optional[str]:
+    running = self._running()
+    if not running: return None
+    import urllib.parse, urllib.request
+    url = f"http://{self.HOST}:{running[1]}/object/password/{urllib.parse.quote(item, safe='')}"
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({})) # never route the vault via a proxy
+    try:
+      with opener.open(url, timeout=10) as response: result = json.load(response)
+      if not isinstance(result, dict) or not result.get("success"): return None
+      data = result.get("data")
+      pw = data.get("data") if isinstance(data, dict) else None
+    except (OSError, ValueError, KeyError, TypeError) as e:
+      logger.debug("bw serve request failed: %s", e)
+      return None
+    return pw if isinstance(pw, str) else None
+
+  def _running(self) -> Optional[Tuple[int, int, str, str]]:
+    try:
+      pid, port, start_time, *digest = self.pid_file.read_text().split() # older files carry no digest
+      running = int(pid), int(port), start_time, "".join(digest)
+    except (OSError, ValueError): return None
+    if not _is_same_process(running[0], start_time):
+      logger.debug("bw serve %s is gone, removing stale PID file", pid)
+      self.pid_file.unlink(missing_ok=True)
+      return None
+    return running
 
 class CopyCommand:
-  PID_FILE_NAME = "bw_clear.pid"
-  def __init__(self, cfg: Config):
+  PID_FILE_NAME: ClassVar[str] = "bw_clear.pid"
+  UNIT_FILE_NAME: ClassVar[str] = "bw_clear.unit" # marks a scheduled systemd timer
+  CLEAR_UNIT: ClassVar[str] = "bwx-clear"
+  CLEAR_ENV: ClassVar[Tuple[str, ...]] = ("DISPLAY", "WAYLAND_DISPLAY", "XAUTHORITY")
+  def __init__(self, cfg: Config, env: Mapping[str, str]) -> None:
     self.cfg = cfg
+    self.env = env
     self.pid_file = self.cfg.get_transient_path() / self.PID_FILE_NAME
+    self.unit_file = self.cfg.get_transient_path() / self.UNIT_FILE_NAME
 
   def execute(self, item: str) -> None:
     if not self.cfg.is_copy_enabled():
       raise ValueError("clipboard copy command not configured")
-    logger.debug(f"copy for: '{item}'")
-    try: pw = subprocess.check_output([self.cfg.bw_cmd, "get", "password", item], text=True).strip()
-    except SubprocessError: return # bw_cmd prints error message
-    logger.debug(f"copying to clipboard...")
-    copy_process = subprocess.Popen(self.cfg.clipboard_copy_cmd, stdin=subprocess.PIPE, text=True)
+    logger.debug("copy for: '%s'", item)
+    pw = ServeDaemon(self.cfg).get_password(item) if self.cfg.bw_serve else None
+    if pw is None:
+      try: pw = _spawn_capture(self.cfg._bw_path, [self.cfg.bw_cmd, "get", "password", item], self.env)
+      except SubprocessError: return # bw_cmd prints error message
+    logger.debug("copying to clipboard...")
+    r, w = os.pipe()
+    try: copy_process = subprocess.Popen(self.cfg.clipboard_copy_cmd, executable=self.cfg._copy_path,
+      stdin=r, stdout=subprocess.DEVNULL)
+    except OSError:
+      os.close(w)
+      raise
+    finally: os.close(r)
     self._copy_clear_cancel()
-    copy_process.communicate(pw)
-    logger.debug(f"copy done")
+    try: os.write(w, pw.encode())
+    finally: os.close(w)
+    copy_process.wait()
+    logger.debug("copy done")
     self._copy_clear_fork()
 
   def _copy_clear_fork(self) -> None:
     if not self.cfg.is_clear_enabled():
       logger.debug("copy clear not enabled, skipping")
       return
-    if os.fork() != 0: return # parent exits
+    if self._copy_clear_schedule(): return
+    r, w = os.pipe() # written to by _copy_clear_cancel to wake us up
+    if os.fork() != 0: # parent exits
+      os.close(r)
+      os.close(w)
+      return
     pid = os.getpid()
-    logger.debug(f"{pid}:forked")
+    logger.debug("%s:forked", pid)
     if not self.cfg.debug: os.setsid() # detach from tty/signals
-    signal.signal(signal.SIGTERM, lambda signum, frame: self._copy_clear_cleanup(signum))
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0)) # fallback cancel, still cleans up
     try:
-      self.pid_file.write_text(str(pid))
-      logger.debug(f"{pid}:sleeping for {self.cfg.clipboard_clear_timeout}s")
-      time.sleep(self.cfg.clipboard_clear_timeout)
-      logger.debug(f"{pid}:clearing clipboard")
-      subprocess.run(self.cfg.clipboard_clear_cmd)
+      self.pid_file.write_text(f"{pid} {w} {os.fstat(w).st_ino} {_proc_start_time(pid) or '-'}")
+      logger.debug("%s:waiting for %ss", pid, self.cfg.clipboard_clear_timeout)
+      cancelled, _, _ = select.select([r], [], [], self.cfg.clipboard_clear_timeout)
+      if cancelled:
+        logger.debug("%s:cancelled", pid)
+      else:
+        logger.debug("%s:clearing clipboard", pid)
+        subprocess.run(self.cfg.clipboard_clear_cmd, executable=self.cfg._clear_path)
     finally:
       self._copy_clear_cleanup()
       os._exit(0)
 
+  def _copy_clear_schedule(self) -> bool:
+    if not self.cfg._systemd_run_path: return False
+    cmd = [self.cfg._systemd_run_path, "--user", "--quiet", "--collect", f"--unit={self.CLEAR_UNIT}",
+      f"--on-active={self.cfg.clipboard_clear_timeout}s", "--timer-property=RemainAfterElapse=no"]
+    cmd += [f"--setenv={var}" for var in self.CLEAR_ENV if var in os.environ]
+    cmd += ["--", self.cfg._clear_path] + self.cfg.clipboard_clear_cmd[1:]
+    try: subprocess.run(cmd, check=True, stderr=subprocess.DEVNULL)
+    except (OSError, SubprocessError):
+      logger.debug("systemd-run unavailable, falling back to fork")
+      return False
+    self.unit_file.touch(mode=0o600)
+    logger.debug("scheduled clipboard clear in %ss via systemd", self.cfg.clipboard_clear_timeout)
+    return True
+
   def _copy_clear_cancel(self) -> None:
-    if not self.pid_file.is_file(): return
-    pid = int(self.pid_file.read_text())
+    if not self.cfg.is_clear_enabled(): return
+    try: self.unit_file.unlink()
+    except FileNotFoundError: pass
+    else:
+      if self.cfg._systemctl_path:
+        subprocess.run([self.cfg._systemctl_path, "--user", "stop", f"{self.CLEAR_UNIT}.timer"],
+          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try: pid, fd, ino, start_time = self.pid_file.read_text().split()
+    except (FileNotFoundError, ValueError): return
+    if not os.path.isdir("/proc/self/fd"): # no procfs, fall back to signal
+      _terminate(int(pid), start_time)
+      return
+    try: wake_fd = os.open(f"/proc/{pid}/fd/{fd}", os.O_WRONLY | os.O_NONBLOCK)
+    except FileNotFoundError:
+      logger.debug("process %s not found, likely already gone", pid)
+      return
+    except OSError as e: # e.g. EACCES with hidepid, fall back to signal
+      logger.debug("cannot wake process %s: %s", pid, e)
+      _terminate(int(pid), start_time)
+      return
     try:
-      os.kill(pid, signal.SIGTERM)
-      logger.debug(f"sent SIGTERM to existing process {pid}")
-    except ProcessLookupError:
-      logger.debug(f"process {pid} not found, likely already gone")
-      pass
-
-  def _copy_clear_cleanup(self, signum=None) -> None:
-    if signum is not None:
-      logger.debug(f"{os.getpid()}:received cleanup signal {signum}")
+      if os.fstat(wake_fd).st_ino == int(ino): # guard against pid/fd reuse
+        os.write(wake_fd, b"\0")
+        logger.debug("woke up existing process %s", pid)
+    finally: os.close(wake_fd)
+
+  def _copy_clear_cleanup(self) -> None:
+    pid = os.getpid()
+    try:
+      if self.pid_file.read_text().split()[0] != str(pid): return # already replaced
+    except (OSError, IndexError): return
     self.pid_file.unlink(missing_ok=True)
-    logger.debug(f"{os.getpid()}:removed its PID file")
-    if signum is not None:
-      os._exit(0)
+    logger.debug("%s:removed its PID file", pid)
 
 class Bwx:
-  def __init__(self, cfg: Config, cli_input: CliInput):
+  CLEAR_CMDS: ClassVar[FrozenSet[str]] = frozenset(("lock", "logout"))
+  NO_UNLOCK_CMDS: ClassVar[FrozenSet[str]] = frozenset(("login", "config", "help"))
+  HANDLERS: ClassVar[Dict[str, str]] = { # command -> method, others are passed through
+    "unlock": "_unlock",
+    "cp": "_copy",
+    "copy": "_copy",
+    "pw": "_pw",
+  }
+
+  def __init__(self, cfg: Config, cli_input: CliInput) -> None:
     self.cfg = cfg
     self.cli_input = cli_input
+    self.env: Mapping[str, str] = os.environ
 
   def run(self) -> int:
     cmd = self.cli_input.cmd
-    if cmd in ("lock", "logout"):
+    if cmd in self.CLEAR_CMDS:
       Session(self.cfg).clear()
-    elif not cmd in ("login", "config", "help"):
-      Session(self.cfg).unlock()
-    if cmd == "unlock":
-      return 0;
-    elif cmd in ("cp", "copy"):
-      copy = CopyCommand(self.cfg)
-      copy.execute(" ".join(self.cli_input.cmd_input))
-      return 0
-    else:
-      fw_cmd = [self.cfg.bw_cmd] + self.cli_input.global_flags
-      if cmd == "pw": fw_cmd += ["get", "password"]
-      else: fw_cmd += [cmd]
-      fw_cmd += self.cli_input.cmd_input
-      logger.debug(f"passing command to '{fw_cmd}'")
-      os.execvp(self.cfg.bw_cmd, fw_cmd)
+    elif cmd not in self.NO_UNLOCK_CMDS:
+      self.env = {**os.environ, Session.SESSION_ENV: Session(self.cfg).unlock()}
+    handler: Callable[[], int] = getattr(self, self.HANDLERS.get(cmd, "_passthrough"))
+    return handler()
 
-if __name__ == "__main__":
+  def _unlock(self) -> int:
+    return 0
+
+  def _copy(self) -> int:
+    copy = CopyCommand(self.cfg, self.env)
+    copy.execute(" ".join(self.cli_input.cmd_input))
+    return 0
+
+  def _pw(self) -> int:
+    return self._passthrough(["get", "password"])
+
+  def _passthrough(self, bw_args: Optional[List[str]] = None) -> int:
+    fw_cmd = [self.cfg.bw_cmd] + self.cli_input.global_flags
+    fw_cmd += bw_args or [self.cli_input.cmd]
+    fw_cmd += self.cli_input.cmd_input
+    logger.debug("passing command to '%s'", fw_cmd)
+    os.execve(self.cfg._bw_path, fw_cmd, self.env)
+
+def main() -> int:
   logging.basicConfig(stream=sys.stderr, level=logging.WARN)
-  logger = logging.getLogger("bwx")
   try: 
     config = Config.from_yaml()
     if config.debug: logger.setLevel(logging.DEBUG)
     cli_input = CliInput()
     cli_input.parse(sys.argv[1:])
     bwx = Bwx(config, cli_input)
-    status = bwx.run()
-    sys.exit(status)
-  except (yaml.YAMLError, ValueError, OSError, SubprocessError) as e:
+    return bwx.run()
+  except (ValueError, OSError, SubprocessError) as e:
     logger.error(e)
-    sys.exit(1)
+    return 1
+
+if __name__ == "__main__":
+  sys.exit(main())